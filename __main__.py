@@ -54,14 +54,14 @@ def main():
     if not src_auth_token:
         logger.error(
             "Source auth token is required."
-            + " Specify it with the environment variable SRC_CLOCKIFY_API_KEY"
+            " Specify it with the environment variable SRC_CLOCKIFY_API_KEY"
         )
         return
 
     if not dest_auth_token:
         logger.info(
             "Destination auth token not specified."
-            + " Using source auth token as destination auth token."
+            " Using source auth token as destination auth token."
         )
         dest_auth_token = src_auth_token
 
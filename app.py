@@ -1,32 +1,49 @@
 """Lambda handler to sync time entries and projects between workspaces"""
 
 import datetime
-import traceback
 import os
 import json
-from typing import List, Dict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
 
 import boto3
+from botocore.exceptions import ClientError
 
-from src.api.main import sync_projects, sync_time_entries
+from src.api.main import clear_projects_cache, sync_projects, sync_time_entries
 from src.util.setup_logger import setup_logger
 
 ERROR_SNS_TOPIC_ARN = os.getenv("ERROR_SNS_TOPIC_ARN")
 
-if ERROR_SNS_TOPIC_ARN:
-    sns_client = boto3.client("sns")
+# Created on the first error so invocations without errors skip the SNS client setup
+_sns_client = None
+_sns_client_lock = threading.Lock()
 
 secrets_manager_client = boto3.client("secretsmanager")
 
+SYNC_STATE_TABLE_NAME = os.getenv("SYNC_STATE_TABLE_NAME")
+PROJECT_SYNC_INTERVAL_SECONDS = int(os.getenv("PROJECT_SYNC_INTERVAL_SECONDS", "3600"))
+
+if SYNC_STATE_TABLE_NAME:
+    dynamodb_client = boto3.client("dynamodb")
+
 logger = setup_logger()
 
 
 def handle_error(message):
     """Log error and publish to SNS if configured"""
-    logger.error(message, traceback.print_exc())
+    global _sns_client  # pylint: disable=global-statement
+
+    logger.error("%s", message, exc_info=True)
 
     if ERROR_SNS_TOPIC_ARN:
-        sns_client.publish(
+        # Errors can be reported from several tenant threads at once
+        with _sns_client_lock:
+            if _sns_client is None:
+                _sns_client = boto3.client("sns")
+
+        _sns_client.publish(
             TopicArn=ERROR_SNS_TOPIC_ARN,
             Message=message,
         )
@@ -51,41 +68,134 @@ def get_secret(secret_name: str) -> Dict:
     return secret_data
 
 
-SYNC_START_DATE = (datetime.datetime.utcnow() - datetime.timedelta(days=1)).isoformat(
-    timespec="seconds"
-) + "Z"
+# Maximum number of secrets returned by a single BatchGetSecretValue call
+SECRETS_BATCH_SIZE = 20
 
-SYNC_END_DATE = datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z"
 
+def get_secrets_batch(secret_names: List[str]) -> Dict[str, Dict]:
+    """Get and parse secret data for multiple secrets from AWS Secrets Manager
 
-def handler(_event, _context):
-    """Lambda handler to sync time entries and projects between workspaces"""
+    Secrets are fetched in batches with BatchGetSecretValue, falling back to
+    one GetSecretValue call per secret if the batch call is not permitted.
+    """
+    secrets = {}
 
-    logger.info("Starting sync between %s and %s", SYNC_START_DATE, SYNC_END_DATE)
+    for i in range(0, len(secret_names), SECRETS_BATCH_SIZE):
+        batch_names = secret_names[i : i + SECRETS_BATCH_SIZE]
 
-    secret_names = get_secret_names()
+        try:
+            response = secrets_manager_client.batch_get_secret_value(
+                SecretIdList=batch_names
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] != "AccessDeniedException":
+                raise
 
-    if not secret_names:
-        raise ValueError(
-            "No secret names provided in SECRET_NAMES environment variable"
-        )
+            logger.warning(
+                "Not allowed to batch fetch secrets, fetching them one at a time"
+            )
+            for secret_name in batch_names:
+                secrets[secret_name] = get_secret(secret_name)
+            continue
 
-    for secret_name in secret_names:
-        secret = get_secret(secret_name)
+        for secret_value in response["SecretValues"]:
+            secrets[secret_value["Name"]] = json.loads(secret_value["SecretString"])
 
-        if not secret:
-            raise ValueError(f"Missing secret with name {secret_name}")
+        for error in response.get("Errors", []):
+            logger.error(
+                "Failed to fetch secret %s: %s",
+                error["SecretId"],
+                error["Message"],
+            )
+
+    return secrets
+
+
+def get_last_project_sync(secret_name: str) -> Optional[float]:
+    """Get the epoch time of the last successful project sync for a secret"""
+    response = dynamodb_client.get_item(
+        TableName=SYNC_STATE_TABLE_NAME,
+        Key={"secret_name": {"S": secret_name}},
+        ProjectionExpression="last_project_sync_epoch",
+    )
+
+    try:
+        return float(response["Item"]["last_project_sync_epoch"]["N"])
+    except KeyError:
+        return None
+
+
+def set_last_project_sync(secret_name: str, epoch: float):
+    """Store the epoch time of the last successful project sync for a secret"""
+    dynamodb_client.update_item(
+        TableName=SYNC_STATE_TABLE_NAME,
+        Key={"secret_name": {"S": secret_name}},
+        UpdateExpression="SET last_project_sync_epoch = :epoch",
+        ExpressionAttributeValues={":epoch": {"N": str(epoch)}},
+    )
+
+
+def should_sync_projects(secret_name: str) -> bool:
+    """Check if projects were not synced for a secret within the sync interval"""
+    if not SYNC_STATE_TABLE_NAME:
+        return True
+
+    try:
+        last_project_sync = get_last_project_sync(secret_name)
+    except ClientError:
+        logger.warning("Failed to get sync state for secret %s", secret_name)
+        return True
+
+    if last_project_sync is None:
+        return True
+
+    return time.time() - last_project_sync >= PROJECT_SYNC_INTERVAL_SECONDS
+
+
+def record_project_sync(secret_name: str):
+    """Record a successful project sync for a secret if sync state is enabled"""
+    if not SYNC_STATE_TABLE_NAME:
+        return
+
+    try:
+        set_last_project_sync(secret_name, time.time())
+    except ClientError:
+        logger.warning("Failed to update sync state for secret %s", secret_name)
 
-        time_entry_src_auth_header = {"X-Api-Key": secret["token"]}
-        try:
-            time_entry_dest_auth_header = {"X-Api-Key": secret["dest_token"]}
-        except KeyError:
-            time_entry_dest_auth_header = time_entry_src_auth_header
 
-        project_options_string = secret.get("project_options", None)
-        if project_options_string:
-            project_options = json.loads(project_options_string)
+SYNC_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 
+# Maximum number of secrets synced at the same time
+MAX_CONCURRENT_TENANTS = 10
+
+
+def process_tenant(secret_name: str, secret: Dict, start_date: str, end_date: str):
+    """Sync a single secret, reporting any failure instead of raising it"""
+
+    try:
+        sync_tenant(secret_name, secret, start_date, end_date)
+    except Exception:
+        handle_error(f"Failed to sync secret {secret_name}.")
+
+
+def sync_tenant(secret_name: str, secret: Dict, start_date: str, end_date: str):
+    """Sync projects and time entries for a single secret"""
+
+    if not secret:
+        raise ValueError(f"Missing secret with name {secret_name}")
+
+    time_entry_src_auth_header = {"X-Api-Key": secret["token"]}
+    try:
+        time_entry_dest_auth_header = {"X-Api-Key": secret["dest_token"]}
+    except KeyError:
+        time_entry_dest_auth_header = time_entry_src_auth_header
+
+    project_options = None
+    project_options_string = secret.get("project_options", None)
+    if project_options_string:
+        project_options = json.loads(project_options_string)
+
+    if should_sync_projects(secret_name):
         logger.info("Syncing projects for secret %s...", secret_name)
         logger.debug("Using project options: %s", project_options)
         try:
@@ -99,25 +209,73 @@ def handler(_event, _context):
             )
         except Exception:
             handle_error(f"Failed to sync projects for secret {secret_name}.")
-            continue
+            return
+
+        record_project_sync(secret_name)
 
         logger.info("Done syncing projects for secret %s", secret_name)
+    else:
+        logger.info(
+            "Projects for secret %s were synced recently, skipping", secret_name
+        )
 
-        logger.info("Syncing time entries for secret %s...", secret_name)
-        try:
-            sync_time_entries(
-                src_auth_header=time_entry_src_auth_header,
-                src_workspace_client_id=secret["time_entry_source_client_id"],
-                src_workspace_id=secret["time_entry_source_workspace_id"],
-                src_user_id=secret["user_id"],
-                start_date=SYNC_START_DATE,
-                dest_user_id=secret.get("dest_user_id"),
-                end_date=SYNC_END_DATE,
-                dest_workspace_id=secret["time_entry_destination_workspace_id"],
-                dest_auth_header=time_entry_dest_auth_header,
-            )
-        except Exception:
-            handle_error(f"Failed to sync time entries for secret {secret_name}.")
-            continue
+    logger.info("Syncing time entries for secret %s...", secret_name)
+    try:
+        sync_time_entries(
+            src_auth_header=time_entry_src_auth_header,
+            src_workspace_client_id=secret["time_entry_source_client_id"],
+            src_workspace_id=secret["time_entry_source_workspace_id"],
+            src_user_id=secret["user_id"],
+            start_date=start_date,
+            dest_user_id=secret.get("dest_user_id"),
+            end_date=end_date,
+            dest_workspace_id=secret["time_entry_destination_workspace_id"],
+            dest_auth_header=time_entry_dest_auth_header,
+        )
+    except Exception:
+        handle_error(f"Failed to sync time entries for secret {secret_name}.")
+        return
+
+    logger.info("Done syncing time entries for secret %s", secret_name)
+
+
+def handler(_event, _context):
+    """Lambda handler to sync time entries and projects between workspaces"""
+
+    # Computed per invocation so warm containers don't reuse a stale window
+    now = datetime.datetime.now(datetime.timezone.utc)
+    sync_start_date = (now - datetime.timedelta(days=1)).strftime(SYNC_DATE_FORMAT)
+    sync_end_date = now.strftime(SYNC_DATE_FORMAT)
+
+    logger.info("Starting sync between %s and %s", sync_start_date, sync_end_date)
+
+    secret_names = get_secret_names()
+
+    if not secret_names:
+        raise ValueError(
+            "No secret names provided in SECRET_NAMES environment variable"
+        )
 
-        logger.info("Done syncing time entries for secret %s", secret_name)
+    secrets = get_secrets_batch(secret_names)
+
+    # Secrets are independent of each other, so they are synced concurrently
+    try:
+        with ThreadPoolExecutor(
+            max_workers=min(MAX_CONCURRENT_TENANTS, len(secret_names))
+        ) as executor:
+            futures = [
+                executor.submit(
+                    process_tenant,
+                    secret_name,
+                    secrets.get(secret_name),
+                    sync_start_date,
+                    sync_end_date,
+                )
+                for secret_name in secret_names
+            ]
+
+            for future in futures:
+                future.result()
+    finally:
+        # Don't let warm invocations reuse projects fetched by earlier invocations
+        clear_projects_cache()
@@ -4,15 +4,63 @@ Main module for the Clockify API.
 Simple library for interacting with the Clockify API.
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional, Dict, List
-from copy import deepcopy
-import json
+from urllib.parse import urlencode
 import logging
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
+_BASE_URL = "https://api.clockify.me/api/v1"
+_URL_USER = _BASE_URL + "/user"
+_URL_WORKSPACES = _BASE_URL + "/workspaces"
+_URL_CLIENTS = _URL_WORKSPACES + "/{workspace_id}/clients"
+_URL_PROJECTS = _URL_WORKSPACES + "/{workspace_id}/projects"
+_URL_TIME_ENTRIES = _URL_WORKSPACES + "/{workspace_id}/time-entries"
+_URL_USER_TIME_ENTRIES = _URL_WORKSPACES + "/{workspace_id}/user/{user_id}/time-entries"
+
+# Unfiltered project lists by workspace id and auth header, see get_all_projects
+_projects_cache: Dict[tuple, List] = {}
+
+# Shared session so connections to the Clockify API are kept alive and reused
+# between calls and across warm Lambda invocations.
+# Requests are made from nested thread pools (secrets, lookups, POST fan-outs), so the
+# number of requests in flight is capped to the pool size to keep every request on a
+# pooled connection and to stay gentle on the Clockify rate limit.
+_MAX_CONCURRENT_REQUESTS = 16
+_REQUEST_SLOTS = threading.BoundedSemaphore(_MAX_CONCURRENT_REQUESTS)
+_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=_MAX_CONCURRENT_REQUESTS)
+_SESSION = requests.Session()
+_SESSION.mount("https://", _ADAPTER)
+
+# Open a connection at import time (the Lambda init phase) so the first real request
+# doesn't pay for the TLS handshake. The response is irrelevant and failures are
+# ignored, as the connection is then simply opened by the first real request.
+try:
+    _SESSION.head(_BASE_URL + "/", timeout=1.0)
+except requests.RequestException:
+    pass
+
+# Rate limited (429) and server error responses to GET requests are retried with
+# backoff. POST requests are not idempotent, so for them only connection errors are
+# retried here (the request was never sent) and 429s are handled by post_request.
+# Retries are enabled after the warm-up so a slow network can't stall the import.
+_RETRY_BACKOFF_FACTOR = 0.5
+_ADAPTER.max_retries = Retry(
+    total=5,
+    backoff_factor=_RETRY_BACKOFF_FACTOR,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=frozenset(["GET"]),
+    respect_retry_after_header=True,
+)
+_POST_RATE_LIMIT_RETRIES = 5
+
 
 def get_auth_header(api_key):
     """Create an auth header for the Clockify API."""
@@ -23,7 +71,7 @@ def get_auth_header(api_key):
 def get_workspaces(auth_header):
     """Get all workspaces for the currently logged in user."""
 
-    url = "https://api.clockify.me/api/v1/workspaces"
+    url = _URL_WORKSPACES
 
     return get_request(url=url, auth_header=auth_header)
 
@@ -31,7 +79,7 @@ def get_workspaces(auth_header):
 def get_clients(auth_header, workspace_id):
     """Get all clients in a workspace."""
 
-    url = f"https://api.clockify.me/api/v1/workspaces/{workspace_id}/clients"
+    url = _URL_CLIENTS.format(workspace_id=workspace_id)
 
     return get_request(url=url, auth_header=auth_header)
 
@@ -39,7 +87,7 @@ def get_clients(auth_header, workspace_id):
 def get_currently_logged_in_user(auth_header):
     """Get the currently logged in user."""
 
-    url = "https://api.clockify.me/api/v1/user"
+    url = _URL_USER
 
     return get_request(url=url, auth_header=auth_header)
 
@@ -47,9 +95,11 @@ def get_currently_logged_in_user(auth_header):
 def get_user_time_entries(user_id, workspace_id, start_date, end_date, auth_header):
     """Get all time entries for a user in a workspace between two dates."""
 
-    query_params = f"start={start_date}&end={end_date}&in-progress=false"
+    query_params = urlencode(
+        {"start": start_date, "end": end_date, "in-progress": "false"}
+    )
     url = (
-        f"https://api.clockify.me/api/v1/workspaces/{workspace_id}/user/{user_id}/time-entries"
+        _URL_USER_TIME_ENTRIES.format(workspace_id=workspace_id, user_id=user_id)
         + f"?{query_params}"
     )
 
@@ -59,62 +109,122 @@ def get_user_time_entries(user_id, workspace_id, start_date, end_date, auth_head
 def add_new_time_entry(entry, workspace_id, auth_header):
     """Add a new time entry to a workspace."""
 
-    url = f"https://api.clockify.me/api/v1/workspaces/{workspace_id}/time-entries"
+    url = _URL_TIME_ENTRIES.format(workspace_id=workspace_id)
 
     return post_request(url=url, data=entry, auth_header=auth_header)
 
 
+def _post_entries_concurrent(entries, workspace_id, auth_header, max_workers=16):
+    """Add multiple time entries to a workspace concurrently."""
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(add_new_time_entry, entry, workspace_id, auth_header)
+            for entry in entries
+        ]
+
+        for future in as_completed(futures):
+            future.result()
+
+
 def get_all_clients(workspace_id, auth_header):
     """Get all clients in a workspace."""
 
-    url = f"https://api.clockify.me/api/v1/workspaces/{workspace_id}/clients"
+    url = _URL_CLIENTS.format(workspace_id=workspace_id)
 
     return get_request(url=url, auth_header=auth_header)
 
 
 def get_all_projects(workspace_id, auth_header, client_id=None):
-    """Get all projects in a workspace."""
+    """Get all projects in a workspace.
+
+    Unfiltered project lists are cached until clear_projects_cache is called.
+    """
+
+    cache_key = (workspace_id, tuple(sorted(auth_header.items())))
+    if not client_id and cache_key in _projects_cache:
+        return _projects_cache[cache_key]
 
     query_params = ""
     if client_id:
-        query_params = f"clients={client_id}"
+        query_params = urlencode({"clients": client_id})
 
-    url = f"https://api.clockify.me/api/v1/workspaces/{workspace_id}/projects?{query_params}"
+    url = _URL_PROJECTS.format(workspace_id=workspace_id) + f"?{query_params}"
 
-    return get_request(url=url, auth_header=auth_header)
+    projects = get_request(url=url, auth_header=auth_header)
+
+    if not client_id:
+        _projects_cache[cache_key] = projects
+
+    return projects
+
+
+def clear_projects_cache():
+    """Clear the cached project lists of get_all_projects."""
+
+    _projects_cache.clear()
+
+
+def _invalidate_projects_cache(workspace_id):
+    """Remove the cached project lists of a workspace."""
+
+    # Iterate over a copy, as other threads may add entries in the meantime
+    for cache_key in list(_projects_cache):
+        if cache_key[0] == workspace_id:
+            _projects_cache.pop(cache_key, None)
 
 
 def add_new_project(workspace_id, project, auth_header):
     """Add a new project to a workspace."""
 
-    url = f"https://api.clockify.me/api/v1/workspaces/{workspace_id}/projects"
+    url = _URL_PROJECTS.format(workspace_id=workspace_id)
 
     return post_request(url=url, auth_header=auth_header, data=project)
 
 
-def post_request(url, data, auth_header):
-    """Make a POST request to the Clockify API."""
-
-    headers = auth_header.copy()
-    headers["Content-Type"] = "application/json"
+def raise_for_error_response(result):
+    """Raise an error if a Clockify API response is not ok.
 
-    result = requests.post(url, headers=headers, data=json.dumps(data), timeout=30)
+    Transient errors are retried before a response gets here. When a GET request
+    runs out of retries, requests raises a RetryError instead and the error body
+    of the response is not logged.
+    """
 
     if not result.ok:
         logger.error(result.json())
         raise RuntimeError(f"Request not ok: {result.status_code} {result.reason}")
 
+
+def post_request(url, data, auth_header):
+    """Make a POST request to the Clockify API."""
+
+    # Rate limited requests were rejected before being processed, so they are
+    # safe to send again, unlike requests that failed with a server error
+    for attempt in range(_POST_RATE_LIMIT_RETRIES + 1):
+        with _REQUEST_SLOTS:
+            result = _SESSION.post(url, headers=auth_header, json=data, timeout=30)
+
+        if result.status_code != 429 or attempt == _POST_RATE_LIMIT_RETRIES:
+            break
+
+        try:
+            delay = float(result.headers["Retry-After"])
+        except (KeyError, ValueError):
+            delay = _RETRY_BACKOFF_FACTOR * 2**attempt
+        time.sleep(delay)
+
+    raise_for_error_response(result)
+
     return result.json()
 
 
 def get_request(url, auth_header):
     """Make a GET request to the Clockify API."""
 
-    result = requests.get(url, headers=auth_header, timeout=30)
+    with _REQUEST_SLOTS:
+        result = _SESSION.get(url, headers=auth_header, timeout=30)
 
-    if not result.ok:
-        logger.error(result.json())
-        raise RuntimeError(f"Request not ok: {result.status_code} {result.reason}")
+    raise_for_error_response(result)
 
     return result.json()
 
@@ -132,9 +242,9 @@ def get_missing_projects(
         dest_workspace_id, dest_auth_header, dest_workspace_client_id
     )
 
-    dest_projects_for_client_names = [
+    dest_projects_for_client_names = {
         project["name"] for project in dest_projects_for_client
-    ]
+    }
 
     all_src_projects = get_all_projects(src_workspace_id, src_auth_header)
 
@@ -170,6 +280,7 @@ def sync_projects(
         logger.info("All projects are already synced!")
         return
 
+    new_projects = []
     for project in dest_workspace_missing_projects:
         new_project = copy_dict_keys(src_dict=project, dest_dict={}, keys=["name"])
         new_project["clientId"] = dest_workspace_client_id
@@ -181,22 +292,22 @@ def sync_projects(
                 keys=["color"],
             )
 
-        add_new_project(
-            dest_workspace_id,
-            new_project,
-            dest_auth_header,
-        )
+        new_projects.append(new_project)
 
-    dest_projects_for_client_updated = get_all_projects(
-        dest_workspace_id, dest_auth_header, dest_workspace_client_id
-    )
+    # The cached project lists of the workspace are outdated once projects are added
+    _invalidate_projects_cache(dest_workspace_id)
 
-    dest_projects_for_client_updated_names = [
-        project["name"] for project in dest_projects_for_client_updated
-    ]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        added_projects = executor.map(
+            lambda new_project: add_new_project(
+                dest_workspace_id, new_project, dest_auth_header
+            ),
+            new_projects,
+        )
+        added_project_names = {project["name"] for project in added_projects}
 
     for project in dest_workspace_missing_projects:
-        if project["name"] not in dest_projects_for_client_updated_names:
+        if project["name"] not in added_project_names:
             raise RuntimeError(
                 f"Project \"{project['name']}\" was not added correctly!"
             )
@@ -220,37 +331,70 @@ def sync_time_entries(
     if not dest_user_id:
         dest_user_id = src_user_id
 
-    src_time_entries = get_user_time_entries(
-        src_user_id, src_workspace_id, start_date, end_date, src_auth_header
-    )
+    # The lookups below are independent of each other, so fetch them concurrently.
+    # The destination projects are only needed if entries are missing, but fetching
+    # them speculatively is cheaper than waiting for them afterwards.
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        src_time_entries_future = executor.submit(
+            get_user_time_entries,
+            user_id=src_user_id,
+            workspace_id=src_workspace_id,
+            start_date=start_date,
+            end_date=end_date,
+            auth_header=src_auth_header,
+        )
+        src_client_projects_future = executor.submit(
+            get_all_projects,
+            workspace_id=src_workspace_id,
+            client_id=src_workspace_client_id,
+            auth_header=src_auth_header,
+        )
+        dest_current_time_entries_future = executor.submit(
+            get_user_time_entries,
+            user_id=dest_user_id,
+            workspace_id=dest_workspace_id,
+            start_date=start_date,
+            end_date=end_date,
+            auth_header=dest_auth_header,
+        )
+        dest_projects_future = executor.submit(
+            get_all_projects,
+            workspace_id=dest_workspace_id,
+            auth_header=dest_auth_header,
+        )
 
-    src_client_projects = get_all_projects(
-        workspace_id=src_workspace_id,
-        client_id=src_workspace_client_id,
-        auth_header=src_auth_header,
-    )
+        src_time_entries = src_time_entries_future.result()
+        src_client_projects = src_client_projects_future.result()
+        dest_current_time_entries = dest_current_time_entries_future.result()
+        dest_projects = dest_projects_future.result()
 
-    src_project_ids_for_client = [project["id"] for project in src_client_projects]
+    src_project_ids_for_client = {project["id"] for project in src_client_projects}
 
-    dest_current_time_entries = get_user_time_entries(
-        user_id=dest_user_id,
-        workspace_id=dest_workspace_id,
-        start_date=start_date,
-        end_date=end_date,
-        auth_header=dest_auth_header,
-    )
+    hash_entry = hash_time_entry
+    hashed_dest_time_entries = {
+        hash_entry(entry) for entry in dest_current_time_entries
+    }
 
-    hashed_dest_time_entries = [
-        hash_time_entry(entry) for entry in dest_current_time_entries
+    # Only the fields below are used from here on, so pick them out once
+    # instead of looking them up in the nested entry dicts repeatedly
+    src_time_entry_fields = [
+        (
+            entry["projectId"],
+            entry["timeInterval"]["start"],
+            entry["timeInterval"]["end"],
+            entry["description"],
+        )
+        for entry in src_time_entries
     ]
 
     # Filter out time entries that are not for the client
     # or already in the destination workspace
+    hash_fields = hash_time_entry_fields
     missing_time_entries = [
-        entry
-        for entry in src_time_entries
-        if entry["projectId"] in src_project_ids_for_client
-        and hash_time_entry(entry) not in hashed_dest_time_entries
+        (project_id, start, end, description)
+        for project_id, start, end, description in src_time_entry_fields
+        if project_id in src_project_ids_for_client
+        and hash_fields(start, end, description) not in hashed_dest_time_entries
     ]
 
     logger.info("Found %i missing time entries!", len(missing_time_entries))
@@ -259,69 +403,79 @@ def sync_time_entries(
         logger.info("All time entries are already synced!")
         return
 
-    dest_projects = get_all_projects(
-        workspace_id=dest_workspace_id, auth_header=dest_auth_header
-    )
-
     src_to_dest_project_map = map_src_to_dest_project_ids(
         src_client_projects=src_client_projects,
         dest_projects=dest_projects,
     )
 
-    for entry in missing_time_entries:
+    formatted_entries = []
+    for project_id, start, end, description in missing_time_entries:
         try:
-            formatted_entry = {
-                "projectId": src_to_dest_project_map[entry["projectId"]],
-                "start": entry["timeInterval"]["start"],
-                "end": entry["timeInterval"]["end"],
-                "description": entry["description"],
-            }
+            formatted_entries.append(
+                {
+                    "projectId": src_to_dest_project_map[project_id],
+                    "start": start,
+                    "end": end,
+                    "description": description,
+                }
+            )
         except KeyError:
             logger.error(
                 "Project '%s' was not found in the destination workspace!"
-                + " Skipping time entry...",
-                entry["projectId"],
+                " Skipping time entry...",
+                project_id,
             )
             continue
-        add_new_time_entry(formatted_entry, dest_workspace_id, dest_auth_header)
+
+    _post_entries_concurrent(formatted_entries, dest_workspace_id, dest_auth_header)
 
 
 def map_src_to_dest_project_ids(src_client_projects, dest_projects):
     """Map source project ids to destination project ids."""
 
-    dest_project_map = {}
-    for project in dest_projects:
-        dest_project_map[project["name"]] = project["id"]
+    dest_project_map = {project["name"]: project["id"] for project in dest_projects}
+
+    src_to_dest_project_map = {
+        project["id"]: dest_project_map[project["name"]]
+        for project in src_client_projects
+        if project["name"] in dest_project_map
+    }
 
-    src_to_dest_project_map = {}
     for project in src_client_projects:
-        try:
-            src_to_dest_project_map[project["id"]] = dest_project_map[project["name"]]
-        except KeyError:
+        if project["id"] not in src_to_dest_project_map:
             logger.error(
                 "Project '%s' was not found in the destination workspace!",
                 project["name"],
             )
-            continue
 
     return src_to_dest_project_map
 
 
 def hash_time_entry(entry):
-    """Hash a time entry."""
+    """Hash a time entry.
 
-    return hash(
-        (
-            entry["timeInterval"]["start"],
-            entry["timeInterval"]["end"],
-            entry["description"],
-        )
+    The hash is a plain string so it is stable between processes.
+    """
+
+    return hash_time_entry_fields(
+        entry["timeInterval"]["start"],
+        entry["timeInterval"]["end"],
+        entry["description"],
     )
 
 
+def hash_time_entry_fields(start, end, description):
+    """Hash the fields of a time entry the same way as hash_time_entry."""
+
+    return f"{start}|{end}|{description}"
+
+
 def copy_dict_keys(src_dict: Dict, dest_dict, keys: List[str]):
-    """Copy keys from one dict to another."""
+    """Copy keys from one dict to another.
+
+    Values are not copied, so this is only meant for immutable values like strings.
+    """
     for key in keys:
-        dest_dict[key] = deepcopy(src_dict[key])
+        dest_dict[key] = src_dict[key]
 
     return dest_dict
@@ -2,27 +2,34 @@
 
 import datetime
 import logging
+import sys
+from operator import itemgetter
 
 logger = logging.getLogger(__name__)
+_LOG_ERROR = logger.error
+_PARSE_DATE = datetime.datetime.fromisoformat
 
 
 def prompt_selection(options, prompt="Select an option:"):
     """Prompt the user to select an option from a list of options.
 
+    The options can be any iterable, as they are only iterated once.
     The user's selection is returned as an index.
     """
+    # Build the menu once and write it at once instead of one write per option
+    header = "\n#####################################\n" + prompt + "\n"
+    body = "\n".join(f"{i + 1}). {option}" for i, option in enumerate(options))
+    menu = header + body + "\n\n"
+
     selection = None
     while selection is None:
-        print("\n#####################################")
-        print(prompt)
-        for i, option in enumerate(options):
-            print(f"{i + 1}). {option}")
-        print()
+        sys.stdout.write(menu)
+        sys.stdout.flush()
 
         try:
             selection = int(input())
         except ValueError:
-            logger.error("Invalid selection. Please enter valid number from the list.")
+            _LOG_ERROR("Invalid selection. Please enter valid number from the list.")
 
     return selection - 1
 
@@ -39,19 +46,18 @@ def prompt_date(default, prompt="Enter a date"):
     """Prompt the user to enter a date."""
     date_input = input(f"{prompt} ({default}):")
 
-    if not date_input:
+    # The default is already formatted, so it doesn't need to be parsed again
+    if not date_input or date_input == default:
         return default
 
-    return (
-        datetime.datetime.fromisoformat(date_input).isoformat(timespec="seconds") + "Z"
-    )
+    return _PARSE_DATE(date_input).replace(microsecond=0).isoformat() + "Z"
 
 
 def select_named_item(items, prompt):
     """Prompt the user to select an item from a list of items."""
-    try:
-        item_names = [item["name"] for item in items]
-    except KeyError:
-        logger.error("Items must have a 'name' key.")
+    if not all("name" in item for item in items):
+        raise ValueError("Items must have a 'name' key.")
+
+    item_names = map(itemgetter("name"), items)
     selected_item_index = prompt_selection(item_names, prompt)
     return items[selected_item_index]
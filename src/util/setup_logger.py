@@ -1,5 +1,10 @@
 import logging
 
+# Thread and process details are not part of the log format, so skip collecting them
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
 
 def setup_logger(log_level=logging.INFO):
     logger = logging.getLogger()
@@ -10,7 +15,10 @@ def setup_logger(log_level=logging.INFO):
         handler = logging.StreamHandler()
         handler.setLevel(log_level)
         handler.setFormatter(
-            fmt=logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+            fmt=logging.Formatter(
+                "%(asctime)s - %(levelname)s - %(message)s",
+                datefmt="%Y-%m-%dT%H:%M:%S",
+            )
         )
         logger.addHandler(handler)
 